@@ -1,7 +1,7 @@
 #!/usr/bin/env python3
 # /// script
 # requires-python = ">=3.11"
-# dependencies = ["pyyaml"]
+# dependencies = ["pyyaml"]  # uses the libyaml C loader when available
 # ///
 """Sync GitHub secrets across multiple repositories.
 
@@ -10,39 +10,54 @@ Usage:
     uv run scripts/sync_secrets.py list CLAUDE_CODE_OAUTH_TOKEN
     uv run scripts/sync_secrets.py sync CLAUDE_CODE_OAUTH_TOKEN
     uv run scripts/sync_secrets.py sync --all
+    uv run scripts/sync_secrets.py sync --all --skip-existing
     uv run scripts/sync_secrets.py sync CLAUDE_CODE_OAUTH_TOKEN --dry-run
 """
 
 from __future__ import annotations
 
 import argparse
-import getpass
-import json
+import functools
 import os
+import re
 import subprocess
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from pathlib import Path
 from typing import TYPE_CHECKING
 
-import yaml
-
 if TYPE_CHECKING:
-    from collections.abc import Sequence
+    from collections.abc import Iterable, Sequence
+    from concurrent.futures import Future
 
 SCRIPT_DIR = Path(__file__).parent
 CONFIG_FILE = SCRIPT_DIR / "secrets.yaml"
 
+# Upper bound on concurrent gh calls, to stay clear of GitHub's secondary rate limits
+MAX_WORKERS = 8
+# Tighter cap for writes, which count against GitHub's concurrent write limits
+MAX_WRITE_WORKERS = 6
+
+# First column of a `gh secret list` table row
+_SECRET_NAME_RE = re.compile(r"^([^\t\n]+)\t", re.MULTILINE)
+
 
-@dataclass
+@dataclass(slots=True)
 class KeychainConfig:
     """Configuration for keychain lookup."""
 
     service: str
     json_path: str | None = None  # e.g., "claudeAiOauth.accessToken"
+    json_path_parts: tuple[str, ...] = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.json_path_parts = (
+            tuple(self.json_path.split(".")) if self.json_path else ()
+        )
 
 
-@dataclass
+@dataclass(slots=True)
 class SecretDef:
     """Definition of a secret."""
 
@@ -51,30 +66,40 @@ class SecretDef:
     keychain: KeychainConfig | None = None
 
 
-@dataclass
+@dataclass(slots=True)
 class RepoDef:
     """Definition of a repository."""
 
     name: str
-    secrets: list[str]
+    secrets: frozenset[str]
 
 
-@dataclass
+@dataclass(slots=True)
 class Config:
     """Configuration loaded from secrets.yaml."""
 
     secrets: dict[str, SecretDef]
     repos: dict[str, RepoDef]
+    repos_by_secret: dict[str, list[RepoDef]]  # secret name -> repos needing it
 
     @classmethod
+    @functools.lru_cache(maxsize=1)
     def load(cls, path: Path = CONFIG_FILE) -> Config:
-        """Load configuration from YAML file."""
+        """Load configuration from YAML file (cached per path)."""
+        import yaml  # Deferred so that --help doesn't pay for it
+
+        Loader: type[yaml.SafeLoader | yaml.CSafeLoader]
+        try:
+            Loader = yaml.CSafeLoader
+        except AttributeError:  # PyYAML built without libyaml
+            Loader = yaml.SafeLoader
+
         with path.open() as f:
-            data = yaml.safe_load(f)
+            data = yaml.load(f, Loader=Loader)
 
-        secrets = {}
+        secrets: dict[str, SecretDef] = {}
         for name, info in data.get("secrets", {}).items():
-            keychain = None
+            keychain: KeychainConfig | None = None
             if info and "keychain" in info:
                 kc = info["keychain"]
                 keychain = KeychainConfig(
@@ -87,21 +112,24 @@ class Config:
                 keychain=keychain,
             )
 
-        repos = {}
+        repos: dict[str, RepoDef] = {}
         for name, info in data.get("repos", {}).items():
             repos[name] = RepoDef(
                 name=name,
-                secrets=info.get("secrets", []),
+                secrets=frozenset(info.get("secrets", [])),
             )
 
-        return cls(secrets=secrets, repos=repos)
+        repos_by_secret: dict[str, list[RepoDef]] = {}
+        for repo in repos.values():
+            for secret_name in repo.secrets:
+                repos_by_secret.setdefault(secret_name, []).append(repo)
 
+        return cls(secrets=secrets, repos=repos, repos_by_secret=repos_by_secret)
 
-def get_from_keychain(config: KeychainConfig) -> str | None:
-    """Get a secret value from macOS Keychain.
 
-    Returns the value if found, None otherwise.
-    """
+@functools.lru_cache(maxsize=None)
+def _keychain_lookup(service: str) -> str | None:
+    """Read a generic password from the macOS login keychain (cached per service)."""
     if sys.platform != "darwin":
         return None
 
@@ -110,7 +138,7 @@ def get_from_keychain(config: KeychainConfig) -> str | None:
             [
                 "security",
                 "find-generic-password",
-                "-s", config.service,
+                "-s", service,
                 "-a", os.environ.get("USER", ""),
                 "-w",
             ],
@@ -118,57 +146,174 @@ def get_from_keychain(config: KeychainConfig) -> str | None:
             text=True,
             check=True,
         )
-        value = result.stdout.strip()
+    except subprocess.CalledProcessError:
+        return None
+    return result.stdout.strip()
+
+
+def prefetch_keychain_items(services: Iterable[str]) -> None:
+    """Read several keychain items concurrently, once per unique service."""
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        list(executor.map(_keychain_lookup, set(services)))
+
+
+def get_from_keychain(config: KeychainConfig) -> str | None:
+    """Get a secret value from macOS Keychain.
+
+    Returns the value if found, None otherwise.
+    """
+    import json
+
+    value = _keychain_lookup(config.service)
+    if value is None:
+        return None
 
-        # If json_path is specified, extract the nested value
-        if config.json_path and value:
+    # If json_path is specified, extract the nested value
+    if config.json_path_parts and value:
+        try:
             data = json.loads(value)
-            for key in config.json_path.split("."):
+            for key in config.json_path_parts:
                 data = data[key]
-            return str(data)
+        except (json.JSONDecodeError, KeyError):
+            return None
+        return str(data)
+
+    return value
 
-        return value
-    except (subprocess.CalledProcessError, json.JSONDecodeError, KeyError):
-        return None
 
+@functools.lru_cache(maxsize=1)
+def _gh_env() -> dict[str, str]:
+    """Environment for gh commands, with the auth token resolved only once.
 
-def run_gh(args: Sequence[str], *, check: bool = True) -> subprocess.CompletedProcess[str]:
-    """Run a gh CLI command."""
+    Without GH_TOKEN, every gh invocation looks up its token in the system
+    credential store on its own.
+    """
+    env = dict(os.environ)
+    if env.get("GH_TOKEN") or env.get("GITHUB_TOKEN"):
+        return env
+
+    result = subprocess.run(
+        ["gh", "auth", "token"],
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    token = result.stdout.strip()
+    if result.returncode == 0 and token:
+        env["GH_TOKEN"] = token
+    return env
+
+
+def run_gh(
+    args: Sequence[str],
+    *,
+    check: bool = True,
+    capture_stdout: bool = True,
+    input: str | None = None,
+) -> subprocess.CompletedProcess[str]:
+    """Run a gh CLI command.
+
+    With capture_stdout=False, stdout is discarded and only stderr is captured.
+    If input is given, it is passed to gh on stdin.
+    """
     return subprocess.run(
         ["gh", *args],
-        capture_output=True,
+        input=input,
+        stdout=subprocess.PIPE if capture_stdout else subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
         text=True,
         check=check,
+        env=_gh_env(),
     )
 
 
-def secret_exists(repo: str, name: str) -> bool:
-    """Check if a secret exists in a repository."""
+@functools.lru_cache(maxsize=None)
+def _list_secrets(repo: str) -> frozenset[str]:
+    """List the names of all secrets in a repository (cached per repo)."""
+    import json
+
+    result = run_gh(["secret", "list", "--repo", repo, "--json", "name"], check=False)
+    if result.returncode == 0:
+        # Output is: [{"name": "NAME"}, ...]
+        return frozenset(entry["name"] for entry in json.loads(result.stdout))
+    if "unknown flag: --json" not in result.stderr:
+        return frozenset()
+
+    # Older gh releases only print a table; each line is: NAME\tUpdated ...\n
     result = run_gh(["secret", "list", "--repo", repo], check=False)
     if result.returncode != 0:
-        return False
-    # Each line is: NAME\tUpdated ...\n
-    for line in result.stdout.splitlines():
-        if line.split("\t")[0] == name:
-            return True
-    return False
+        return frozenset()
+    return frozenset(_SECRET_NAME_RE.findall(result.stdout))
+
 
+def prefetch_secret_lists(repos: Iterable[str]) -> None:
+    """Fetch the secret lists of several repositories concurrently."""
+    _gh_env()  # Resolve the token once before fanning out
+    with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+        list(executor.map(_list_secrets, set(repos)))
 
-def set_secret(repo: str, name: str, value: str, *, dry_run: bool = False) -> bool:
-    """Set a secret in a repository."""
-    if dry_run:
-        print(f"  [dry-run] Would set {name} in {repo}")
-        return True
 
+def secret_exists(repo: str, name: str) -> bool:
+    """Check if a secret exists in a repository."""
+    return name in _list_secrets(repo)
+
+
+def set_secret(repo: str, name: str, value: str) -> tuple[bool, str]:
+    """Set a secret in a repository.
+
+    Returns whether it succeeded and gh's error output if it did not.
+    """
+    # Pass the value on stdin rather than --body to keep it out of the process list
     result = run_gh(
-        ["secret", "set", name, "--repo", repo, "--body", value],
+        ["secret", "set", name, "--repo", repo],
         check=False,
+        capture_stdout=False,
+        input=value,
     )
     if result.returncode != 0:
-        print(f"  ✗ Failed to set {name} in {repo}: {result.stderr.strip()}")
-        return False
-    print(f"  ✓ Set {name} in {repo}")
-    return True
+        return False, result.stderr.strip()
+    return True, ""
+
+
+def collect_secret_values(
+    config: Config, secret_names: Sequence[str]
+) -> dict[str, str] | None:
+    """Get each secret value from the keychain, prompting as a fallback.
+
+    Returns None if any value is empty.
+    """
+    prefetch_keychain_items(
+        kc.service
+        for name in secret_names
+        if (kc := config.secrets[name].keychain) is not None
+    )
+
+    secret_values: dict[str, str] = {}
+    for secret_name in secret_names:
+        secret_def = config.secrets[secret_name]
+        value: str | None = None
+
+        # Try keychain first
+        if secret_def.keychain:
+            value = get_from_keychain(secret_def.keychain)
+            if value:
+                print(f"  ✓ Got {secret_name} from keychain")
+
+        # Fall back to prompting
+        if not value:
+            if sys.stdin.isatty():
+                import getpass
+
+                value = getpass.getpass(f"Enter value for {secret_name}: ")
+            else:
+                value = sys.stdin.readline().strip()
+
+        if not value:
+            print(f"Error: Empty value for {secret_name}")
+            return None
+        secret_values[secret_name] = value
+
+    return secret_values
 
 
 def cmd_list(args: argparse.Namespace) -> int:
@@ -176,7 +321,15 @@ def cmd_list(args: argparse.Namespace) -> int:
     config = Config.load()
 
     # Filter to specific secret if provided
-    secret_names = [args.secret] if args.secret else list(config.secrets.keys())
+    secret_names: list[str] = (
+        [args.secret] if args.secret else list(config.secrets.keys())
+    )
+
+    prefetch_secret_lists(
+        repo.name
+        for name in secret_names
+        for repo in config.repos_by_secret.get(name, [])
+    )
 
     for secret_name in secret_names:
         if secret_name not in config.secrets:
@@ -190,9 +343,7 @@ def cmd_list(args: argparse.Namespace) -> int:
         print()
 
         # Find repos that need this secret
-        repos_needing = [
-            repo for repo in config.repos.values() if secret_name in repo.secrets
-        ]
+        repos_needing = config.repos_by_secret.get(secret_name, [])
 
         for repo in repos_needing:
             exists = secret_exists(repo.name, secret_name)
@@ -207,6 +358,7 @@ def cmd_sync(args: argparse.Namespace) -> int:
     config = Config.load()
 
     # Determine which secrets to sync
+    secret_names: list[str]
     if args.all:
         secret_names = list(config.secrets.keys())
     elif args.secret:
@@ -220,50 +372,79 @@ def cmd_sync(args: argparse.Namespace) -> int:
             print(f"Unknown secret: {secret_name}")
             return 1
 
+    # gh secret set overwrites, so existing secrets only need to be looked up
+    # when they are to be skipped. Do that in the background while the values
+    # are read from the keychain or prompted for.
+    prefetch: Future[None] | None = None
+    if args.skip_existing:
+        background = ThreadPoolExecutor(max_workers=1)
+        prefetch = background.submit(
+            prefetch_secret_lists,
+            [
+                repo.name
+                for name in secret_names
+                for repo in config.repos_by_secret.get(name, [])
+            ],
+        )
+        background.shutdown(wait=False)
+
     # Get each secret value (skip if dry-run)
-    secret_values: dict[str, str] = {}
+    secret_values: dict[str, str] | None = {}
     if not args.dry_run:
-        for secret_name in secret_names:
-            secret_def = config.secrets[secret_name]
-            value = None
-
-            # Try keychain first
-            if secret_def.keychain:
-                value = get_from_keychain(secret_def.keychain)
-                if value:
-                    print(f"  ✓ Got {secret_name} from keychain")
-
-            # Fall back to prompting
-            if not value:
-                if sys.stdin.isatty():
-                    value = getpass.getpass(f"Enter value for {secret_name}: ")
-                else:
-                    value = sys.stdin.readline().strip()
+        secret_values = collect_secret_values(config, secret_names)
+    if secret_values is None:
+        return 1
 
-            if not value:
-                print(f"Error: Empty value for {secret_name}")
-                return 1
-            secret_values[secret_name] = value
+    if prefetch is not None:
+        prefetch.result()  # Wait for the lookups, re-raising any error
 
-    # Sync each secret to repos that need it
+    # Collect the (secret, repo) pairs to set
+    tasks: list[tuple[str, str]] = []
+    if not args.dry_run:
+        tasks = [
+            (secret_name, repo.name)
+            for secret_name in secret_names
+            for repo in config.repos_by_secret.get(secret_name, [])
+            if not (args.skip_existing and secret_exists(repo.name, secret_name))
+        ]
+
+    # Set them concurrently
+    results: dict[tuple[str, str], tuple[bool, str]] = {}
+    if tasks:
+        _gh_env()  # Resolve the token once before fanning out
+        with ThreadPoolExecutor(max_workers=MAX_WRITE_WORKERS) as executor:
+            results = dict(
+                zip(
+                    tasks,
+                    executor.map(
+                        lambda t: set_secret(t[1], t[0], secret_values[t[0]]), tasks
+                    ),
+                )
+            )
+
+    # Report the outcome for each secret
+    failed = 0
     for secret_name in secret_names:
         print(f"\nSyncing {secret_name}...")
 
-        repos_needing = [
-            repo for repo in config.repos.values() if secret_name in repo.secrets
-        ]
-
-        for repo in repos_needing:
-            exists = secret_exists(repo.name, secret_name)
-            if exists:
+        for repo in config.repos_by_secret.get(secret_name, []):
+            if (secret_name, repo.name) in results:
+                ok, error = results[secret_name, repo.name]
+                if ok:
+                    print(f"  ✓ Set {secret_name} in {repo.name}")
+                else:
+                    failed += 1
+                    print(f"  ✗ Failed to set {secret_name} in {repo.name}: {error}")
+            elif args.skip_existing and secret_exists(repo.name, secret_name):
                 print(f"  ✓ {repo.name} (already set)")
-            elif args.dry_run:
-                print(f"  [dry-run] Would set {secret_name} in {repo.name}")
             else:
-                set_secret(repo.name, secret_name, secret_values[secret_name])
+                print(f"  [dry-run] Would set {secret_name} in {repo.name}")
+
+    if results:
+        print(f"\n{len(results) - failed} set, {failed} failed")
 
     print("\nDone.")
-    return 0
+    return 1 if failed else 0
 
 
 def main() -> int:
@@ -284,6 +465,11 @@ def main() -> int:
     sync_parser.add_argument(
         "--dry-run", action="store_true", help="Preview without making changes"
     )
+    sync_parser.add_argument(
+        "--skip-existing",
+        action="store_true",
+        help="Leave secrets that are already set untouched instead of overwriting",
+    )
 
     args = parser.parse_args()
 